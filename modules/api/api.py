@@ -1,45 +1,92 @@
-import base64
 import io
 import os
+import struct
 import time
 import datetime
 import uvicorn
 import ipaddress
+import socket
 import requests
-import gradio as gr
 from threading import Lock
 from io import BytesIO
 from fastapi import APIRouter, Depends, FastAPI, Request, Response
 from fastapi.security import HTTPBasic, HTTPBasicCredentials
 from fastapi.exceptions import HTTPException
-from fastapi.responses import JSONResponse
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from fastapi.encoders import jsonable_encoder
 from secrets import compare_digest
+from starlette.background import BackgroundTask
 
 import modules.shared as shared
 from modules import images, errors, restart, script_callbacks, infotext_utils
 from modules.api import models
+from modules.api_proxy import RemoteSDAPIClient
 from modules.shared import opts
 from PIL import PngImagePlugin
 from typing import Any
+from urllib.parse import urlparse
 import piexif
 import piexif.helper
 
+try:
+    import pybase64
+    from pybase64 import b64encode_as_string
+except ImportError:
+    import base64 as pybase64
+
+    def b64encode_as_string(s):
+        return pybase64.b64encode(s).decode("ascii")
+
 # Local processing functions removed for remote API proxy
 
 
+def _usercomment_exif_template():
+    """Splits an EXIF blob holding only a UserComment into the bytes before its length field and the bytes between that field and the comment."""
+
+    comment = piexif.helper.UserComment.dump("", encoding="unicode")
+    template = piexif.dump({"Exif": {piexif.ExifIFD.UserComment: comment}})
+    count_at = template.rindex(struct.pack(">HH", piexif.ExifIFD.UserComment, piexif.TYPES.Undefined)) + 4
+    return template[:count_at], template[count_at + 4:len(template) - len(comment)]
+
+
+_usercomment_exif_head, _usercomment_exif_middle = _usercomment_exif_template()
+
+
+def usercomment_exif(text):
+    """Same bytes as piexif.dump() of an EXIF with just a unicode UserComment, without rebuilding the whole structure every time."""
+
+    comment = piexif.helper.UserComment.dump(text, encoding="unicode")
+    return _usercomment_exif_head + struct.pack(">I", len(comment)) + _usercomment_exif_middle + comment
+
+
+# hostname -> time.monotonic() of a lookup that returned a non-global address; only denials are cached, because a
+# cached approval would let the host resolve to a local address for the actual fetch (DNS rebinding)
+denied_hosts_ttl = 60
+denied_hosts_max = 256
+_denied_hosts = {}
+
+
+def resolve_host(host):
+    """Returns the distinct addresses the host resolves to."""
+
+    return list(dict.fromkeys(info[4][0] for info in socket.getaddrinfo(host, None, type=socket.SOCK_STREAM)))
+
+
 def verify_url(url):
     """Returns True if the url refers to a global resource."""
 
-    import socket
-    from urllib.parse import urlparse
     try:
-        parsed_url = urlparse(url)
-        domain_name = parsed_url.netloc
-        host = socket.gethostbyname_ex(domain_name)
-        for ip in host[2]:
+        host = urlparse(url).hostname
+        denied_at = _denied_hosts.get(host)
+        if denied_at is not None and time.monotonic() - denied_at < denied_hosts_ttl:
+            return False
+
+        for ip in resolve_host(host):
             ip_addr = ipaddress.ip_address(ip)
             if not ip_addr.is_global:
+                if len(_denied_hosts) >= denied_hosts_max:
+                    _denied_hosts.clear()
+                _denied_hosts[host] = time.monotonic()
                 return False
     except Exception:
         return False
@@ -64,35 +111,63 @@ def decode_base64_to_image(encoding):
             raise HTTPException(status_code=500, detail="Invalid image url") from e
 
     if encoding.startswith("data:image/"):
-        encoding = encoding.split(";")[1].split(",")[1]
+        encoding = encoding[encoding.find(",", encoding.find(";")) + 1:]
     try:
-        image = images.read(BytesIO(base64.b64decode(encoding)))
+        try:
+            data = pybase64.b64decode(encoding, validate=True)
+        except ValueError:
+            # lenient path for payloads with whitespace or other non-alphabet characters
+            data = pybase64.b64decode(encoding, validate=False)
+        image = images.read(BytesIO(data))
         return image
     except Exception as e:
         raise HTTPException(status_code=500, detail="Invalid encoded image") from e
 
 
+def pnginfo_for_image(image):
+    """Returns a PngInfo with the image's string metadata, or None if there is none."""
+
+    if not image.info:
+        return None
+
+    use_metadata = False
+    metadata = PngImagePlugin.PngInfo()
+    for key, value in image.info.items():
+        if isinstance(key, str) and isinstance(value, str):
+            metadata.add_text(key, value)
+            use_metadata = True
+
+    return metadata if use_metadata else None
+
+
+def preallocated_bytes_io(size):
+    """Returns an empty BytesIO whose internal buffer already has room for size bytes, so writing that much does not regrow it."""
+
+    output_bytes = io.BytesIO()
+    output_bytes.seek(size - 1)
+    output_bytes.write(b"\0")
+    output_bytes.seek(0)
+    return output_bytes
+
+
 def encode_pil_to_base64(image):
-    with io.BytesIO() as output_bytes:
-        if isinstance(image, str):
-            return image
-        if opts.samples_format.lower() == 'png':
-            use_metadata = False
-            metadata = PngImagePlugin.PngInfo()
-            for key, value in image.info.items():
-                if isinstance(key, str) and isinstance(value, str):
-                    metadata.add_text(key, value)
-                    use_metadata = True
-            image.save(output_bytes, format="PNG", pnginfo=(metadata if use_metadata else None), quality=opts.jpeg_quality)
-
-        elif opts.samples_format.lower() in ("jpg", "jpeg", "webp"):
+    if isinstance(image, str):
+        return image
+
+    samples_format = opts.samples_format.lower()
+    # rough size of the encoded file: PNG compresses to about half of RGBA size (2 bytes per pixel), JPEG/WebP to about half a byte per pixel
+    estimated_size = image.width * image.height * (4 if samples_format == 'png' else 1) // 2
+
+    with preallocated_bytes_io(max(estimated_size, 1 << 16)) as output_bytes:
+        if samples_format == 'png':
+            image.save(output_bytes, format="PNG", pnginfo=pnginfo_for_image(image), quality=opts.jpeg_quality)
+
+        elif samples_format in ("jpg", "jpeg", "webp"):
             if image.mode in ("RGBA", "P"):
                 image = image.convert("RGB")
             parameters = image.info.get('parameters', None)
-            exif_bytes = piexif.dump({
-                "Exif": { piexif.ExifIFD.UserComment: piexif.helper.UserComment.dump(parameters or "", encoding="unicode") }
-            })
-            if opts.samples_format.lower() in ("jpg", "jpeg"):
+            exif_bytes = usercomment_exif(parameters or "")
+            if samples_format in ("jpg", "jpeg"):
                 image.save(output_bytes, format="JPEG", exif = exif_bytes, quality=opts.jpeg_quality)
             else:
                 image.save(output_bytes, format="WEBP", exif = exif_bytes, quality=opts.jpeg_quality)
@@ -100,9 +175,30 @@ def encode_pil_to_base64(image):
         else:
             raise HTTPException(status_code=500, detail="Invalid image format")
 
-        bytes_data = output_bytes.getvalue()
+        # drop the unused preallocated tail and encode straight from the buffer without copying it out
+        output_bytes.truncate()
+        with output_bytes.getbuffer() as bytes_data:
+            return b64encode_as_string(bytes_data)
+
 
-    return base64.b64encode(bytes_data)
+# extensions list served by /sdapi/v1/extensions; rebuilding it runs git for every extension
+extensions_list_cache_ttl = 60
+_extensions_list_cache = {"time": 0.0, "data": None}
+
+
+def invalidate_extensions_list_cache():
+    _extensions_list_cache["data"] = None
+
+
+def stream_remote_response(response):
+    """Relays a streamed remote API response to the client chunk by chunk instead of buffering the whole body."""
+
+    return StreamingResponse(
+        response.aiter_bytes(64 * 1024),
+        status_code=response.status_code,
+        media_type=response.headers.get("content-type", "application/json"),
+        background=BackgroundTask(response.aclose),
+    )
 
 
 def api_middleware(app: FastAPI):
@@ -119,29 +215,30 @@ def api_middleware(app: FastAPI):
 
     @app.middleware("http")
     async def log_and_time(req: Request, call_next):
-        ts = time.time()
+        ts = time.monotonic()
         res: Response = await call_next(req)
-        duration = str(round(time.time() - ts, 4))
+        duration = str(round(time.monotonic() - ts, 4))
         res.headers["X-Process-Time"] = duration
-        endpoint = req.scope.get('path', 'err')
-        if shared.cmd_opts.api_log and endpoint.startswith('/sdapi'):
-            print('API {t} {code} {prot}/{ver} {method} {endpoint} {cli} {duration}'.format(
-                t=datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S.%f"),
-                code=res.status_code,
-                ver=req.scope.get('http_version', '0.0'),
-                cli=req.scope.get('client', ('0:0.0.0', 0))[0],
-                prot=req.scope.get('scheme', 'err'),
-                method=req.scope.get('method', 'err'),
-                endpoint=endpoint,
-                duration=duration,
-            ))
+        if shared.cmd_opts.api_log:
+            endpoint = req.scope.get('path', 'err')
+            if endpoint.startswith('/sdapi'):
+                print('API {t} {code} {prot}/{ver} {method} {endpoint} {cli} {duration}'.format(
+                    t=datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S.%f"),
+                    code=res.status_code,
+                    ver=req.scope.get('http_version', '0.0'),
+                    cli=req.scope.get('client', ('0:0.0.0', 0))[0],
+                    prot=req.scope.get('scheme', 'err'),
+                    method=req.scope.get('method', 'err'),
+                    endpoint=endpoint,
+                    duration=duration,
+                ))
         return res
 
     def handle_exception(request: Request, e: Exception):
         err = {
             "error": type(e).__name__,
-            "detail": vars(e).get('detail', ''),
-            "body": vars(e).get('body', ''),
+            "detail": getattr(e, 'detail', ''),
+            "body": getattr(e, 'body', ''),
             "errors": str(e),
         }
         if not isinstance(e, HTTPException):  # do not print backtrace on known httpexceptions
@@ -151,7 +248,7 @@ def api_middleware(app: FastAPI):
                 console.print_exception(show_locals=True, max_frames=2, extra_lines=1, suppress=[anyio, starlette], word_wrap=False, width=min([console.width, 200]))
             else:
                 errors.report(message, exc_info=True)
-        return JSONResponse(status_code=vars(e).get('status_code', 500), content=jsonable_encoder(err))
+        return ORJSONResponse(status_code=getattr(e, 'status_code', 500), content=jsonable_encoder(err))
 
     @app.middleware("http")
     async def exception_handling(request: Request, call_next):
@@ -179,31 +276,36 @@ class Api:
 
         self.router = APIRouter()
         self.app = app
+        self.app.router.default_response_class = ORJSONResponse
         self.queue_lock = queue_lock
         api_middleware(self.app)
-        self.add_api_route("/sdapi/v1/txt2img", self.text2imgapi, methods=["POST"], response_model=models.TextToImageResponse)
-        self.add_api_route("/sdapi/v1/img2img", self.img2imgapi, methods=["POST"], response_model=models.ImageToImageResponse)
-        self.add_api_route("/sdapi/v1/extra-single-image", self.extras_single_image_api, methods=["POST"], response_model=models.ExtrasSingleImageResponse)
-        self.add_api_route("/sdapi/v1/extra-batch-images", self.extras_batch_images_api, methods=["POST"], response_model=models.ExtrasBatchImagesResponse)
-        self.add_api_route("/sdapi/v1/png-info", self.pnginfoapi, methods=["POST"], response_model=models.PNGInfoResponse)
-        self.add_api_route("/sdapi/v1/progress", self.progressapi, methods=["GET"], response_model=models.ProgressResponse)
+
+        self._client = RemoteSDAPIClient()
+        self.app.add_event_handler("shutdown", self._client.aclose)
+
+        self.add_api_route("/sdapi/v1/txt2img", self.text2imgapi, methods=["POST"])
+        self.add_api_route("/sdapi/v1/img2img", self.img2imgapi, methods=["POST"])
+        self.add_api_route("/sdapi/v1/extra-single-image", self.extras_single_image_api, methods=["POST"])
+        self.add_api_route("/sdapi/v1/extra-batch-images", self.extras_batch_images_api, methods=["POST"])
+        self.add_api_route("/sdapi/v1/png-info", self.pnginfoapi, methods=["POST"])
+        self.add_api_route("/sdapi/v1/progress", self.progressapi, methods=["GET"])
         self.add_api_route("/sdapi/v1/interrogate", self.interrogateapi, methods=["POST"])
         self.add_api_route("/sdapi/v1/interrupt", self.interruptapi, methods=["POST"])
         self.add_api_route("/sdapi/v1/skip", self.skip, methods=["POST"])
         self.add_api_route("/sdapi/v1/options", self.get_config, methods=["GET"], response_model=models.OptionsModel)
         self.add_api_route("/sdapi/v1/options", self.set_config, methods=["POST"])
         self.add_api_route("/sdapi/v1/cmd-flags", self.get_cmd_flags, methods=["GET"], response_model=models.FlagsModel)
-        self.add_api_route("/sdapi/v1/samplers", self.get_samplers, methods=["GET"], response_model=list[models.SamplerItem])
-        self.add_api_route("/sdapi/v1/schedulers", self.get_schedulers, methods=["GET"], response_model=list[models.SchedulerItem])
-        self.add_api_route("/sdapi/v1/upscalers", self.get_upscalers, methods=["GET"], response_model=list[models.UpscalerItem])
-        self.add_api_route("/sdapi/v1/latent-upscale-modes", self.get_latent_upscale_modes, methods=["GET"], response_model=list[models.LatentUpscalerModeItem])
-        self.add_api_route("/sdapi/v1/sd-models", self.get_sd_models, methods=["GET"], response_model=list[models.SDModelItem])
-        self.add_api_route("/sdapi/v1/sd-vae", self.get_sd_vaes, methods=["GET"], response_model=list[models.SDVaeItem])
-        self.add_api_route("/sdapi/v1/hypernetworks", self.get_hypernetworks, methods=["GET"], response_model=list[models.HypernetworkItem])
-        self.add_api_route("/sdapi/v1/face-restorers", self.get_face_restorers, methods=["GET"], response_model=list[models.FaceRestorerItem])
-        self.add_api_route("/sdapi/v1/realesrgan-models", self.get_realesrgan_models, methods=["GET"], response_model=list[models.RealesrganItem])
+        self.add_api_route("/sdapi/v1/samplers", self.get_samplers, methods=["GET"])
+        self.add_api_route("/sdapi/v1/schedulers", self.get_schedulers, methods=["GET"])
+        self.add_api_route("/sdapi/v1/upscalers", self.get_upscalers, methods=["GET"])
+        self.add_api_route("/sdapi/v1/latent-upscale-modes", self.get_latent_upscale_modes, methods=["GET"])
+        self.add_api_route("/sdapi/v1/sd-models", self.get_sd_models, methods=["GET"])
+        self.add_api_route("/sdapi/v1/sd-vae", self.get_sd_vaes, methods=["GET"])
+        self.add_api_route("/sdapi/v1/hypernetworks", self.get_hypernetworks, methods=["GET"])
+        self.add_api_route("/sdapi/v1/face-restorers", self.get_face_restorers, methods=["GET"])
+        self.add_api_route("/sdapi/v1/realesrgan-models", self.get_realesrgan_models, methods=["GET"])
         self.add_api_route("/sdapi/v1/prompt-styles", self.get_prompt_styles, methods=["GET"], response_model=list[models.PromptStyleItem])
-        self.add_api_route("/sdapi/v1/embeddings", self.get_embeddings, methods=["GET"], response_model=models.EmbeddingsResponse)
+        self.add_api_route("/sdapi/v1/embeddings", self.get_embeddings, methods=["GET"])
         self.add_api_route("/sdapi/v1/refresh-embeddings", self.refresh_embeddings, methods=["POST"])
         self.add_api_route("/sdapi/v1/refresh-checkpoints", self.refresh_checkpoints, methods=["POST"])
         self.add_api_route("/sdapi/v1/refresh-vae", self.refresh_vae, methods=["POST"])
@@ -247,59 +349,43 @@ class Api:
         # Return empty for remote API
         return []
 
-    def text2imgapi(self, txt2imgreq: models.StableDiffusionTxt2ImgProcessingAPI):
+    async def text2imgapi(self, txt2imgreq: models.StableDiffusionTxt2ImgProcessingAPI):
         # Use remote API
-        from modules.api_proxy import RemoteSDAPIClient
-        client = RemoteSDAPIClient()
         params = txt2imgreq.dict()
-        return client.txt2img(params)
+        return stream_remote_response(await self._client.txt2img(params))
 
-    def img2imgapi(self, img2imgreq: models.StableDiffusionImg2ImgProcessingAPI):
+    async def img2imgapi(self, img2imgreq: models.StableDiffusionImg2ImgProcessingAPI):
         # Use remote API
-        from modules.api_proxy import RemoteSDAPIClient
-        client = RemoteSDAPIClient()
         params = img2imgreq.dict()
-        return client.img2img(params)
+        return stream_remote_response(await self._client.img2img(params))
 
-    def extras_single_image_api(self, req: models.ExtrasSingleImageRequest):
+    async def extras_single_image_api(self, req: models.ExtrasSingleImageRequest):
         # Use remote API
-        from modules.api_proxy import RemoteSDAPIClient
-        client = RemoteSDAPIClient()
         params = req.dict()
-        return client.extras_single_image(params)
+        return stream_remote_response(await self._client.extras_single_image(params))
 
-    def extras_batch_images_api(self, req: models.ExtrasBatchImagesRequest):
+    async def extras_batch_images_api(self, req: models.ExtrasBatchImagesRequest):
         # Use remote API
-        from modules.api_proxy import RemoteSDAPIClient
-        client = RemoteSDAPIClient()
         params = req.dict()
-        return client.extras_batch_images(params)
+        return await self._client.extras_batch_images(params)
 
-    def pnginfoapi(self, req: models.PNGInfoRequest):
+    async def pnginfoapi(self, req: models.PNGInfoRequest):
         # Use remote API
-        from modules.api_proxy import RemoteSDAPIClient
-        client = RemoteSDAPIClient()
         params = req.dict()
-        return client.png_info(params)
+        return stream_remote_response(await self._client.png_info(params))
 
-    def progressapi(self, req: models.ProgressRequest = Depends()):
+    async def progressapi(self, req: models.ProgressRequest = Depends()):
         # Use remote API
-        from modules.api_proxy import RemoteSDAPIClient
-        client = RemoteSDAPIClient()
-        return client.get_progress()
+        return stream_remote_response(await self._client.get_progress())
 
-    def interrogateapi(self, interrogatereq: models.InterrogateRequest):
+    async def interrogateapi(self, interrogatereq: models.InterrogateRequest):
         # Use remote API
-        from modules.api_proxy import RemoteSDAPIClient
-        client = RemoteSDAPIClient()
         params = interrogatereq.dict()
-        return client.interrogate(params)
+        return stream_remote_response(await self._client.interrogate(params))
 
-    def interruptapi(self):
+    async def interruptapi(self):
         # Use remote API
-        from modules.api_proxy import RemoteSDAPIClient
-        client = RemoteSDAPIClient()
-        return client.interrupt()
+        return await self._client.interrupt()
 
     def unloadapi(self):
         # Not applicable for remote API
@@ -309,30 +395,19 @@ class Api:
         # Not applicable for remote API
         return {}
 
-    def skip(self):
+    async def skip(self):
         # Use remote API
-        from modules.api_proxy import RemoteSDAPIClient
-        client = RemoteSDAPIClient()
-        return client.skip()
+        return await self._client.skip()
 
     def get_config(self):
-        options = {}
-        for key in shared.opts.data.keys():
-            metadata = shared.opts.data_labels.get(key)
-            if(metadata is not None):
-                options.update({key: shared.opts.data.get(key, shared.opts.data_labels.get(key).default)})
-            else:
-                options.update({key: shared.opts.data.get(key, None)})
-
-        return options
+        # every key comes from opts.data itself, so a default from data_labels would never be used
+        return dict(shared.opts.data)
 
     def set_config(self, req: dict[str, Any]):
-        checkpoint_name = req.get("sd_model_checkpoint", None)
-        if checkpoint_name is not None and checkpoint_name not in sd_models.checkpoint_aliases:
-            raise RuntimeError(f"model {checkpoint_name!r} not found")
-
+        # Checkpoints live on the remote API, so sd_model_checkpoint cannot be validated locally
+        set_option = shared.opts.set
         for k, v in req.items():
-            shared.opts.set(k, v, is_api=True)
+            set_option(k, v, is_api=True)
 
         shared.opts.save(shared.config_filename)
         return
@@ -389,16 +464,16 @@ class Api:
         return {"loaded": {}, "skipped": {}}
 
     def refresh_embeddings(self):
-        # Not applicable for remote API
-        pass
+        # nothing to refresh locally; just drop the cached /sdapi/v1/extensions listing
+        invalidate_extensions_list_cache()
 
     def refresh_checkpoints(self):
-        # Not applicable for remote API
-        pass
+        # nothing to refresh locally; just drop the cached /sdapi/v1/extensions listing
+        invalidate_extensions_list_cache()
 
     def refresh_vae(self):
-        # Not applicable for remote API
-        pass
+        # nothing to refresh locally; just drop the cached /sdapi/v1/extensions listing
+        invalidate_extensions_list_cache()
 
     def create_embedding(self, args: dict):
         # Not applicable for remote API
@@ -432,6 +507,9 @@ class Api:
         return models.MemoryResponse(ram=ram, cuda=cuda)
 
     def get_extensions_list(self):
+        if _extensions_list_cache["data"] is not None and time.monotonic() - _extensions_list_cache["time"] < extensions_list_cache_ttl:
+            return _extensions_list_cache["data"]
+
         from modules import extensions
         extensions.list_extensions()
         ext_list = []
@@ -448,6 +526,9 @@ class Api:
                     "version":ext.version,
                     "enabled":ext.enabled
                 })
+
+        _extensions_list_cache["data"] = ext_list
+        _extensions_list_cache["time"] = time.monotonic()
         return ext_list
 
     def launch(self, server_name, port, root_path):
@@ -1,116 +1,121 @@
+import asyncio
 import os
-import requests
+import httpx
+import orjson
 from typing import Dict, Any, Optional
 import logging
 
 logger = logging.getLogger(__name__)
 
+BASE_URL = os.getenv('SD_API_URL', 'http://localhost:7860')
+TIMEOUT = int(os.getenv('SD_API_TIMEOUT', '300'))  # 5 minutes default
+
+_JSON_HEADERS = {'Content-Type': 'application/json'}
+
+# how many images of one extras batch are sent to the remote at the same time
+EXTRAS_BATCH_CONCURRENCY = 8
+
+# pool limits of each client; they go to the transport because httpx ignores the client's limits= when a transport is given
+_LIMITS = httpx.Limits(max_connections=256, max_keepalive_connections=64)
+
+
 class RemoteSDAPIClient:
     def __init__(self):
-        self.base_url = os.getenv('SD_API_URL', 'http://localhost:7860')
-        self.timeout = int(os.getenv('SD_API_TIMEOUT', '300'))  # 5 minutes default
-        
-    def txt2img(self, params: Dict[str, Any]) -> Dict[str, Any]:
-        """Call remote txt2img API"""
-        url = f"{self.base_url}/sdapi/v1/txt2img"
+        self.base_url = BASE_URL
+        self.timeout = TIMEOUT
+        # pooled async client for this instance's remote calls; each in-flight request costs a coroutine rather than a thread
+        self._client = httpx.AsyncClient(
+            base_url=BASE_URL,
+            timeout=TIMEOUT,
+            follow_redirects=True,
+            transport=httpx.AsyncHTTPTransport(retries=2, limits=_LIMITS),
+        )
+
+    async def aclose(self):
+        """Close pooled connections to the remote API"""
+        await self._client.aclose()
+
+    async def _send_raw(self, method: str, path: str, name: str, params: Optional[Dict[str, Any]] = None, timeout: Optional[float] = None) -> httpx.Response:
+        """Send a request to the remote API and return the response with its body not yet read, so it can be streamed"""
         try:
-            logger.info(f"Calling remote txt2img API at {url}")
-            response = requests.post(url, json=params, timeout=self.timeout)
+            logger.info(f"Calling remote {name} API at {self.base_url}{path}")
+            if params is None:
+                request = self._client.build_request(method, path, timeout=timeout or self.timeout)
+            else:
+                request = self._client.build_request(method, path, content=orjson.dumps(params), headers=_JSON_HEADERS, timeout=timeout or self.timeout)
+            response = await self._client.send(request, stream=True)
+            if response.is_error:
+                await response.aclose()
             response.raise_for_status()
-            return response.json()
-        except requests.exceptions.RequestException as e:
-            logger.error(f"Failed to call remote txt2img API: {e}")
+            return response
+        except httpx.HTTPError as e:
+            logger.error(f"Failed to call remote {name} API: {e}")
             raise Exception(f"Remote API call failed: {e}")
-    
-    def img2img(self, params: Dict[str, Any]) -> Dict[str, Any]:
-        """Call remote img2img API"""
-        url = f"{self.base_url}/sdapi/v1/img2img"
+
+    async def _post_json(self, path: str, name: str, params: Optional[Dict[str, Any]] = None, timeout: Optional[float] = None) -> Dict[str, Any]:
+        """POST to the remote API and return the decoded JSON response"""
         try:
-            logger.info(f"Calling remote img2img API at {url}")
-            response = requests.post(url, json=params, timeout=self.timeout)
+            if params is None:
+                response = await self._client.post(path, timeout=timeout or self.timeout)
+            else:
+                response = await self._client.post(path, content=orjson.dumps(params), headers=_JSON_HEADERS, timeout=timeout or self.timeout)
             response.raise_for_status()
-            return response.json()
-        except requests.exceptions.RequestException as e:
-            logger.error(f"Failed to call remote img2img API: {e}")
+            return orjson.loads(response.content)
+        except (httpx.HTTPError, orjson.JSONDecodeError) as e:
+            logger.error(f"Failed to call remote {name} API: {e}")
             raise Exception(f"Remote API call failed: {e}")
-    
-    def extras_single_image(self, params: Dict[str, Any]) -> Dict[str, Any]:
+
+    async def txt2img(self, params: Dict[str, Any]) -> httpx.Response:
+        """Call remote txt2img API"""
+        return await self._send_raw("POST", "/sdapi/v1/txt2img", "txt2img", params)
+
+    async def img2img(self, params: Dict[str, Any]) -> httpx.Response:
+        """Call remote img2img API"""
+        return await self._send_raw("POST", "/sdapi/v1/img2img", "img2img", params)
+
+    async def extras_single_image(self, params: Dict[str, Any]) -> httpx.Response:
         """Call remote extras single image API"""
-        url = f"{self.base_url}/sdapi/v1/extra-single-image"
-        try:
-            logger.info(f"Calling remote extras API at {url}")
-            response = requests.post(url, json=params, timeout=self.timeout)
-            response.raise_for_status()
-            return response.json()
-        except requests.exceptions.RequestException as e:
-            logger.error(f"Failed to call remote extras API: {e}")
-            raise Exception(f"Remote API call failed: {e}")
-    
-    def extras_batch_images(self, params: Dict[str, Any]) -> Dict[str, Any]:
-        """Call remote extras batch images API"""
-        url = f"{self.base_url}/sdapi/v1/extra-batch-images"
+        return await self._send_raw("POST", "/sdapi/v1/extra-single-image", "extras", params)
+
+    async def extras_batch_images(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        """Call remote extras single image API for every image of the batch concurrently"""
+        image_list = params.pop("imageList", None) or []
+        semaphore = asyncio.Semaphore(EXTRAS_BATCH_CONCURRENCY)
+
+        async def process(file_data):
+            async with semaphore:
+                return await self._post_json("/sdapi/v1/extra-single-image", "extras", {**params, "image": file_data["data"]})
+
+        logger.info(f"Calling remote extras API at {self.base_url}/sdapi/v1/extra-single-image for {len(image_list)} images")
+        tasks = [asyncio.ensure_future(process(file_data)) for file_data in image_list]
         try:
-            logger.info(f"Calling remote extras batch API at {url}")
-            response = requests.post(url, json=params, timeout=self.timeout)
-            response.raise_for_status()
-            return response.json()
-        except requests.exceptions.RequestException as e:
-            logger.error(f"Failed to call remote extras batch API: {e}")
-            raise Exception(f"Remote API call failed: {e}")
-    
-    def interrogate(self, params: Dict[str, Any]) -> Dict[str, Any]:
+            results = await asyncio.gather(*tasks)
+        finally:
+            # on the first failure, stop the calls that have not finished so the remote does not keep working on a lost batch
+            for task in tasks:
+                task.cancel()
+
+        return {
+            "html_info": results[-1].get("html_info", "") if results else "",
+            "images": [result.get("image") for result in results],
+        }
+
+    async def interrogate(self, params: Dict[str, Any]) -> httpx.Response:
         """Call remote interrogate API"""
-        url = f"{self.base_url}/sdapi/v1/interrogate"
-        try:
-            logger.info(f"Calling remote interrogate API at {url}")
-            response = requests.post(url, json=params, timeout=self.timeout)
-            response.raise_for_status()
-            return response.json()
-        except requests.exceptions.RequestException as e:
-            logger.error(f"Failed to call remote interrogate API: {e}")
-            raise Exception(f"Remote API call failed: {e}")
-    
-    def png_info(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        return await self._send_raw("POST", "/sdapi/v1/interrogate", "interrogate", params)
+
+    async def png_info(self, params: Dict[str, Any]) -> httpx.Response:
         """Call remote PNG info API"""
-        url = f"{self.base_url}/sdapi/v1/png-info"
-        try:
-            logger.info(f"Calling remote PNG info API at {url}")
-            response = requests.post(url, json=params, timeout=self.timeout)
-            response.raise_for_status()
-            return response.json()
-        except requests.exceptions.RequestException as e:
-            logger.error(f"Failed to call remote PNG info API: {e}")
-            raise Exception(f"Remote API call failed: {e}")
-    
-    def get_progress(self) -> Dict[str, Any]:
+        return await self._send_raw("POST", "/sdapi/v1/png-info", "PNG info", params)
+
+    async def get_progress(self) -> httpx.Response:
         """Get progress from remote API"""
-        url = f"{self.base_url}/sdapi/v1/progress"
-        try:
-            response = requests.get(url, timeout=10)
-            response.raise_for_status()
-            return response.json()
-        except requests.exceptions.RequestException as e:
-            logger.error(f"Failed to get progress from remote API: {e}")
-            raise Exception(f"Remote API call failed: {e}")
-    
-    def interrupt(self) -> Dict[str, Any]:
+        return await self._send_raw("GET", "/sdapi/v1/progress", "progress", timeout=10)
+
+    async def interrupt(self) -> Dict[str, Any]:
         """Interrupt remote generation"""
-        url = f"{self.base_url}/sdapi/v1/interrupt"
-        try:
-            response = requests.post(url, timeout=10)
-            response.raise_for_status()
-            return response.json()
-        except requests.exceptions.RequestException as e:
-            logger.error(f"Failed to interrupt remote generation: {e}")
-            raise Exception(f"Remote API call failed: {e}")
-    
-    def skip(self) -> Dict[str, Any]:
+        return await self._post_json("/sdapi/v1/interrupt", "interrupt", timeout=10)
+
+    async def skip(self) -> Dict[str, Any]:
         """Skip current generation on remote"""
-        url = f"{self.base_url}/sdapi/v1/skip"
-        try:
-            response = requests.post(url, timeout=10)
-            response.raise_for_status()
-            return response.json()
-        except requests.exceptions.RequestException as e:
-            logger.error(f"Failed to skip remote generation: {e}")
-            raise Exception(f"Remote API call failed: {e}")
+        return await self._post_json("/sdapi/v1/skip", "skip", timeout=10)
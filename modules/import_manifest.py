@@ -0,0 +1,52 @@
+import importlib.util
+from concurrent.futures import ThreadPoolExecutor
+
+# modules imported when webui.py starts the API-only proxy
+api_only_modules = [
+    "fastapi",
+    "starlette",
+    "pydantic",
+    "uvicorn",
+    "anyio",
+    "httpx",
+    "httpcore",
+    "orjson",
+    "pybase64",
+    "requests",
+    "urllib3",
+    "PIL",
+    "piexif",
+    "psutil",
+    "gradio",
+    "modules.cmd_args",
+    "modules.shared_cmd_options",
+    "modules.shared",
+    "modules.shared_init",
+    "modules.options",
+    "modules.shared_options",
+    "modules.shared_state",
+    "modules.styles",
+    "modules.initialize_util",
+    "modules.call_queue",
+    "modules.api_proxy",
+    "modules.api.models",
+    "modules.api.api",
+]
+
+
+def find_spec_quietly(name):
+    try:
+        importlib.util.find_spec(name)
+    except (ImportError, ValueError):
+        pass
+
+
+def warm_up(names=None):
+    """Looks up the import specs of the listed modules in parallel without executing them.
+
+    This fills sys.path_importer_cache and the path finders' directory listings, so the real imports that
+    follow skip most of the filesystem lookups.
+    """
+
+    with ThreadPoolExecutor(max_workers=8, thread_name_prefix="import-warm-up") as executor:
+        executor.map(find_spec_quietly, api_only_modules if names is None else names)
@@ -3,18 +3,27 @@ import logging
 import os
 import sys
 import warnings
-from threading import Thread
 
 from modules.timer import startup_timer
 
+# webui.py sets SD_API_URL before importing this module
+IS_PROXY = bool(os.getenv('SD_API_URL'))
+
+_imports_done = False
+
 
 def imports():
+    global _imports_done
+    if _imports_done:
+        return
+
     # Skip ML imports for remote API proxy
     print("Skipping ML imports for remote API proxy...")
     
     os.environ.setdefault('GRADIO_ANALYTICS_ENABLED', 'False')
-    import gradio  # noqa: F401
-    startup_timer.record("import gradio")
+    if not IS_PROXY:
+        import gradio  # noqa: F401
+        startup_timer.record("import gradio")
 
     from modules import paths, timer, import_hook, errors  # noqa: F401
     startup_timer.record("setup paths")
@@ -23,8 +32,12 @@ def imports():
     shared_init.initialize()
     startup_timer.record("initialize shared")
 
-    from modules import gradio_extensons  # noqa: F401
-    startup_timer.record("other imports")
+    if not IS_PROXY:
+        # the API-only proxy never builds gradio components
+        from modules import gradio_extensons  # noqa: F401
+        startup_timer.record("other imports")
+
+    _imports_done = True
 
 
 def check_versions():
@@ -37,8 +50,10 @@ def check_versions():
 
 def initialize():
     from modules import initialize_util
-    initialize_util.fix_torch_version()
-    initialize_util.fix_pytorch_lightning()
+    if not IS_PROXY:
+        # torch and pytorch_lightning are only used by local generation
+        initialize_util.fix_torch_version()
+        initialize_util.fix_pytorch_lightning()
     initialize_util.fix_asyncio_event_loop_policy()
     initialize_util.validate_tls_options()
     initialize_util.configure_sigint_handler()
@@ -57,6 +72,11 @@ def initialize_rest(*, reload_script_modules=False):
     """
     from modules.shared_cmd_options import cmd_opts
 
+    if IS_PROXY:
+        # the API-only proxy forwards everything to the remote; extensions and localizations are only used by the UI
+        startup_timer.record("proxy mode skip")
+        return
+
     from modules import extensions
     extensions.list_extensions()
     startup_timer.record("list extensions")
@@ -1,3 +1,5 @@
+import contextlib
+import os
 import time
 import argparse
 
@@ -88,4 +90,9 @@ args = parser.parse_known_args()[0]
 
 startup_timer = Timer(print_log=args.log_startup)
 
+if os.environ.get('SD_NO_STARTUP_TIMING'):
+    # startup timings are only a debugging aid; replace the timer's methods with no-ops
+    startup_timer.record = lambda *args, **kwargs: None
+    startup_timer.subcategory = contextlib.nullcontext
+
 startup_record = None
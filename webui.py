@@ -1,11 +1,10 @@
 from __future__ import annotations
 
 import os
+import sys
 import time
 
 from modules import timer
-from modules import initialize_util
-from modules import initialize
 
 startup_timer = timer.startup_timer
 startup_timer.record("launcher")
@@ -13,31 +12,67 @@ startup_timer.record("launcher")
 # Force proxy mode - no local SD models
 os.environ.setdefault('SD_API_URL', 'http://localhost:7860')
 
+from modules import import_manifest
+import_manifest.warm_up()
+startup_timer.record("warm up imports")
+
+from modules import initialize  # imported after SD_API_URL is set, which decides what it loads
+
 initialize.imports()
 
 initialize.check_versions()
 
+# startup status lines, written out in one go right before the server starts
+_status = []
+
+_cmd_opts = None
+
+
+def get_cmd_opts():
+    """Returns modules.shared_cmd_options.cmd_opts, importing it only on the first call."""
+
+    global _cmd_opts
+    if _cmd_opts is None:
+        from modules.shared_cmd_options import cmd_opts
+        _cmd_opts = cmd_opts
+
+    return _cmd_opts
+
+
+_api_class = None
+_queue_lock = None
+
 
 def create_api(app):
-    from modules.api.api import Api
-    from modules.call_queue import queue_lock
+    global _api_class, _queue_lock
+    if _api_class is None:
+        from modules.api.api import Api
+        from modules.call_queue import queue_lock
+        _api_class, _queue_lock = Api, queue_lock
 
-    api = Api(app, queue_lock)
+    api = _api_class(app, _queue_lock)
     return api
 
 
 def api_only():
     from fastapi import FastAPI
-    from modules.shared_cmd_options import cmd_opts
+    from modules import initialize_util
+    cmd_opts = get_cmd_opts()
+
+    # Skip UI and model initialization for remote API proxy
+    _status.append("Starting Stable Diffusion WebUI Remote API Proxy...")
+    _status.append(f"Remote API URL: {os.getenv('SD_API_URL', 'Not set - using default http://localhost:7860')}")
+    _status.append("Skipping model initialization for remote API proxy...")
 
-    # Skip model initialization for remote API proxy
-    print("Skipping model initialization for remote API proxy...")
-    
     app = FastAPI()
     initialize_util.setup_middleware(app)
     api = create_api(app)
 
-    print(f"Startup time: {startup_timer.summary()}.")
+    _status.append(f"Startup time: {startup_timer.summary()}.")
+    sys.stdout.write("\n".join(_status) + "\n")
+    sys.stdout.flush()
+    _status.clear()
+
     api.launch(
         server_name=initialize_util.gradio_server_name(),
         port=cmd_opts.port if cmd_opts.port else 7861,
@@ -45,25 +80,5 @@ def api_only():
     )
 
 
-def webui():
-    from modules.shared_cmd_options import cmd_opts
-
-    # Force API mode for remote proxy
-    cmd_opts.api = True
-    cmd_opts.nowebui = True
-    
-    # Skip UI initialization for remote API proxy
-    print("Starting Stable Diffusion WebUI Remote API Proxy...")
-    print(f"Remote API URL: {os.getenv('SD_API_URL', 'Not set - using default http://localhost:7860')}")
-    
-    # Use API-only mode
-    api_only()
-
-
 if __name__ == "__main__":
-    from modules.shared_cmd_options import cmd_opts
-
-    if cmd_opts.nowebui:
-        api_only()
-    else:
-        webui()
+    api_only()